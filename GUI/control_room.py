@@ -1,6 +1,7 @@
 import os
 import re
 import logging
+import threading
 from pathlib import Path
 from urllib.parse import urlparse, parse_qs
 
@@ -34,14 +35,20 @@ class TransplantThread(QThread):
     def __init__(self):
         super().__init__()
         self.trpl_settings = None
+        self.stop_event = threading.Event()
+
+    def requestInterruption(self):
+        super().requestInterruption()
+        self.stop_event.set()
 
     def run(self):
+        self.stop_event.clear()
         logger.log(22, gui_text.start)
         key_dict = {
             TR.RED: wb.config.value('le_key_1'),
             TR.OPS: wb.config.value('le_key_2')
         }
-        transplanter = Transplanter(key_dict, **self.trpl_settings)
+        transplanter = Transplanter(key_dict, stop_event=self.stop_event, **self.trpl_settings)
 
         for job in wb.job_data.jobs.copy():
             if self.isInterruptionRequested():
@@ -61,6 +68,8 @@ class TransplantThread(QThread):
             finally:
                 logger.info('')
 
+        transplanter.hashing_report()
+
 
 def start_up():
     wb.main_window = MainWindow()
@@ -173,6 +182,7 @@ def load_config():
     hostdata = wb.config.value('rehost_data')
     if hostdata:
         IH.set_attrs(hostdata)
+    IH.load_stats()
     wb.rehost_table.move_to_priority()
 
 
@@ -261,6 +271,10 @@ def trpl_settings():
         'chb_del_dtors',
         'chb_file_check',
         'chb_post_compare',
+        'chb_drop_page_cache',
+        'spb_io_limit_mb',
+        'spb_io_limit_iops',
+        'chb_reuse_hashes',
         'te_rel_descr_templ',
         'te_rel_descr_own_templ',
         'chb_add_src_descr',
@@ -283,7 +297,9 @@ def trpl_settings():
         whitelist = white_str_nospace.split(',')
         if '' in whitelist:
             whitelist.remove('')
-        settings_dict.update(img_rehost=True, whitelist=whitelist)
+        settings_dict.update(img_rehost=True, whitelist=whitelist,
+                             rehost_race=bool(wb.config.value('chb_rehost_race')),
+                             rehost_adaptive=bool(wb.config.value('chb_rehost_adaptive')))
 
     return settings_dict
 
@@ -543,7 +559,7 @@ def api_key_test(tracker: TR, key: str):
         from gazelle.api_classes import sleeve, RequestFailure
         api = sleeve(tracker, key=key)
         try:
-            account_info = api.account_info
+            account_info = api.refresh_account_info()
         except RequestFailure as e:
             msg_box.setIcon(QMessageBox.Icon.Critical)
             msg_box.setText(gui_text.keycheck_bad_key.format(tracker.name, e))
@@ -67,13 +67,14 @@ keycheck_bad_key = ('Not a valid key\n'
 keycheck_good_key = 'Hello {}, this key is valid'
 
 chb_deep_search = 'Deep search to level:'
+no_limit = 'none'
 
 default_whitelist = "ptpimg.me, thesungod.xyz"
 l_rehost_table = ('Enable image hosts with the checkbox.\n'
                   'Change priority by dragging rows up or down. (drag row header)\n'
                   'Enabled host will be tried from the top down.\n'
                   'If the first one fails the next will be tried and so forth.')
-rehost_columns = ('Host', 'API key')
+rehost_columns = ('Host', 'API key', 'Recent')
 
 l_placeholders = ("Set a custom release description.\n\n"
                   "You can use these placeholders:\n"
@@ -110,10 +111,16 @@ l_save_dtors = 'Save new .torrrents'
 l_del_dtors = 'Delete scanned .torrents'
 l_file_check = 'Check files'
 l_post_compare = 'Post upload checks'
+l_drop_page_cache = 'Drop hashed files from cache'
+l_io_limit_mb = 'Read limit MB/s'
+l_io_limit_iops = 'reads/s'
+l_reuse_hashes = 'Reuse source hashes'
 l_show_tips = "Show tooltips"
 l_verbosity = 'Verbosity'
 l_rehost = 'Rehost cover art'
 l_whitelist = 'Image host whitelist'
+l_rehost_race = 'Race hosts'
+l_rehost_adaptive = 'Fastest hosts first'
 l_style_selector = 'GUI Style'
 l_show_add_dtors = "Show 'Add torrent files' button"
 l_show_rem_tr1 = f"Show '{pb_rem_tr1}' button"
@@ -149,6 +156,15 @@ tooltips = {
     'l_file_check': ("if checked, Transplant will verify that the torrent content (~music files) can be found\n"
                      "This will prevent transplanting torrents that you can't seed"),
     'l_post_compare': "Check if the upload was merged into an existing group or if the log scores are different",
+    'l_drop_page_cache': ("When generating a new .torrent, tell the OS not to keep the hashed files in its cache\n"
+                          "Keeps the cache available for your torrent client. (Linux/BSD only)"),
+    'l_io_limit_mb': ("Limit disk reads when generating a new .torrent\n"
+                      "So your torrent client and other programs on the same disks stay responsive"),
+    'l_reuse_hashes': ("When generating a new .torrent, reuse the piece hashes of the source .torrent\n"
+                       "for files with the same path and size that weren't modified since.\n"
+                       "Only a sample of pieces is checked"),
+    'l_io_limit_iops': ("Max read calls per second when generating a new .torrent\n"
+                        "A read call is up to 4 MiB, several small pieces are read at once"),
     'l_show_tips': "Tip the tools",
     'l_verbosity': ("Level of feedback.\n"
                     "0: silent\n"
@@ -158,6 +174,10 @@ tooltips = {
     'l_rehost': 'Rehost non-whitelisted cover images',
     'l_whitelist': ("Images hosted on these sites will not be rehosted\n"
                     "Comma separated"),
+    'l_rehost_race': ("Don't wait for a slow host before trying the next one\n"
+                      "The next host is started after 2 seconds, the highest priority success is used"),
+    'l_rehost_adaptive': ("Try hosts in order of their recent speed and success rate\n"
+                          "Priority decides between equally good hosts"),
     'pb_def_descr': 'Restore default descriptions',
     'rb_tracker1': ("Select source tracker for torrent id's entered in the paste box\n"
                     "This setting does not apply to url's and .torrents"),
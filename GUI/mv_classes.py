@@ -272,6 +272,8 @@ class RehostModel(QAbstractTableModel):
                 return f' {host.name} '
             if column == 1:
                 return host.key
+            if column == 2 and role == Qt.ItemDataRole.DisplayRole:
+                return str(host.stats)
 
         if role == Qt.ItemDataRole.CheckStateRole and column == 0:
             return Qt.CheckState(host.enabled * 2)
@@ -320,6 +322,7 @@ class RehostTable(QTableView):
         self.verticalHeader().setFixedWidth(22)
         self.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
         self.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.ResizeToContents)
 
     def move_to_priority(self):
         for h in IH.prioritised():
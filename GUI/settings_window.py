@@ -52,6 +52,14 @@ class SettingsWindow(QDialog):
         settings_form.addRow(wb.l_del_dtors, wb.chb_del_dtors)
         settings_form.addRow(wb.l_file_check, wb.chb_file_check)
         settings_form.addRow(wb.l_post_compare, wb.chb_post_compare)
+        settings_form.addRow(wb.l_drop_page_cache, wb.chb_drop_page_cache)
+        io_limits = QHBoxLayout()
+        io_limits.addWidget(wb.spb_io_limit_mb)
+        io_limits.addWidget(wb.l_io_limit_iops)
+        io_limits.addWidget(wb.spb_io_limit_iops)
+        io_limits.addStretch()
+        settings_form.addRow(wb.l_io_limit_mb, io_limits)
+        settings_form.addRow(wb.l_reuse_hashes, wb.chb_reuse_hashes)
         settings_form.addRow(wb.l_show_tips, wb.chb_show_tips)
         settings_form.addRow(wb.l_verbosity, wb.spb_verbosity)
 
@@ -63,6 +71,8 @@ class SettingsWindow(QDialog):
 
         white_l_row = QFormLayout()
         white_l_row.addRow(wb.l_whitelist, wb.le_whitelist)
+        white_l_row.addRow(wb.l_rehost_race, wb.chb_rehost_race)
+        white_l_row.addRow(wb.l_rehost_adaptive, wb.chb_rehost_adaptive)
 
         on_off = QVBoxLayout(wb.rh_on_off_container)
         on_off.setContentsMargins(0, 0, 0, 0)
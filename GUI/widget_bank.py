@@ -45,10 +45,16 @@ CONFIG_NAMES = {
     'chb_del_dtors': (0, True),
     'chb_file_check': (2, True),
     'chb_post_compare': (0, True),
+    'chb_drop_page_cache': (0, True),
+    'chb_reuse_hashes': (0, True),
+    'spb_io_limit_mb': (0, True),
+    'spb_io_limit_iops': (0, True),
     'chb_show_tips': (2, True),
     'spb_verbosity': (2, True),
     'chb_rehost': (0, True),
     'le_whitelist': (gui_text.default_whitelist, True),
+    'chb_rehost_race': (0, True),
+    'chb_rehost_adaptive': (0, True),
     'te_rel_descr_templ': (gui_text.def_rel_descr, False),
     'te_rel_descr_own_templ': (gui_text.def_rel_descr_own, False),
     'te_src_descr_templ': (gui_text.def_src_descr, False),
@@ -312,6 +318,10 @@ class WidgetBank:
         self.spb_deep_search_level.setMinimum(2)
         self.spb_verbosity.setMaximum(3)
         self.spb_verbosity.setMaximumWidth(40)
+        self.spb_io_limit_mb.setMaximum(9999)
+        self.spb_io_limit_mb.setSpecialValueText(gui_text.no_limit)
+        self.spb_io_limit_iops.setMaximum(99999)
+        self.spb_io_limit_iops.setSpecialValueText(gui_text.no_limit)
 
         self.chb_add_src_descr.setText(gui_text.chb_add_src_descr)
 
@@ -1,39 +1,86 @@
 import re
+import json
+import copy
 import time
 import base64
+import random
 import logging
-from hashlib import sha256
+import threading
+from pathlib import Path
+from hashlib import sha256, file_digest
+from functools import partial
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
 from http.cookiejar import LWPCookieJar, LoadError
 
 import requests
-from requests.exceptions import JSONDecodeError
+from requests.adapters import HTTPAdapter
 
 from lib import tp_text
 from gazelle.torrent_info import TorrentInfo
+from gazelle.multipart import MultipartStream
 from gazelle.tracker_data import TR
 
 
 class RequestFailure(Exception):
     pass
 
+
+class AuthFailure(RequestFailure):
+    pass
+
 report = logging.getLogger('tr.api')
 
 
 class BaseApi:
-    def __init__(self, tracker: TR, **kwargs):
+    # (connect, read) seconds
+    timeout = (10, 60)
+    upload_timeout = (10, 180)
+    retries = 3
+    backoff = 1.
+    retry_statuses = (429, 500, 502, 503, 504)
+    binary_types = ('application/x-bittorrent', 'application/octet-stream')
+    chunk_size = 2 ** 16
+    # any callable taking bytes, e.g. orjson.loads
+    json_decoder = staticmethod(json.loads)
+    account_file = Path('account_info.json')
+    account_fields = ('authkey', 'passkey', 'id', 'username')
+    # seconds a stored account info is used before the tracker has to be asked first
+    account_ttl = 86400
+    _account_file_lock = threading.Lock()
+    # identical concurrent GETs of these share one request
+    single_flight_actions = ('torrent', 'torrentgroup', 'index')
+    # lowercase parts of tracker error messages that mean the key or account info is no good
+    auth_errors = ('bad credentials', 'token', 'api key', 'authkey', 'passkey', 'not logged in')
+
+    def __init__(self, tracker: TR, pool_size: int = None, timeout: tuple = None, retries: int = None, **kwargs):
         assert tracker in TR, 'Unknown Tracker'  # TODO uitext
         self.tr = tracker
         self.url = self.tr.site
+        if timeout:
+            self.timeout = tuple(timeout)
+            self.upload_timeout = (timeout[0], max(timeout[1], self.upload_timeout[1]))
+        if retries is not None:
+            self.retries = retries
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or self.tr.req_limit)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
         self.last_x_reqs = deque([.0], maxlen=self.tr.req_limit)
+        self._rate_lock = threading.Lock()
+        self._in_flight: dict[tuple, list] = {}  # key: [future, nr of followers]
+        self._flight_lock = threading.Lock()
+        self.account_id = None
         self.authenticate(**kwargs)
         self._account_info = None
+        self._account_checked = False
 
     def _rate_limit(self):
-        t = time.time() - self.last_x_reqs[0]
-        if t <= 10:
-            time.sleep(10 - t)
+        with self._rate_lock:
+            t = time.time() - self.last_x_reqs[0]
+            if t <= 10:
+                time.sleep(10 - t)
+            self.last_x_reqs.append(time.time())
 
     def authenticate(self, _):
         return NotImplementedError
@@ -45,38 +92,180 @@ class BaseApi:
     @ property
     def account_info(self):
         if not self._account_info:
-            self._account_info = self.get_account_info()
+            self._account_info = self.stored_account_info()
+            if not self._account_info:
+                self.refresh_account_info()
+            elif not self._account_checked:
+                # a passkey reset leaves the api key valid, so check once per process without waiting for it
+                self._account_checked = True
+                threading.Thread(target=self._check_account_info, daemon=True).start()
 
         return self._account_info
 
     def get_account_info(self):
         r = self.request('index')
-        return {k: r[k] for k in ('authkey', 'passkey', 'id', 'username')}
+        return {k: r[k] for k in self.account_fields}
+
+    def _check_account_info(self):
+        try:
+            self.refresh_account_info()
+        except Exception as e:
+            report.debug(f'{self.tr.name} account info check failed: {e}')
+
+    def refresh_account_info(self) -> dict:
+        self._account_checked = True
+        self._account_info = self.get_account_info()
+        self.store_account_info(self._account_info)
+        return self._account_info
+
+    def forget_account_info(self):
+        self._account_info = None
+        self.store_account_info(None)
+
+    def valid_account_info(self, info) -> bool:
+        return (isinstance(info, dict) and all(info.get(k) for k in self.account_fields)
+                and isinstance(info['id'], int))
+
+    def _stored_accounts(self) -> dict:
+        try:
+            return json.loads(self.account_file.read_text())
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def stored_account_info(self) -> dict | None:
+        if not self.account_id:
+            return
+        entry = self._stored_accounts().get(self.account_id)
+        if not isinstance(entry, dict) or time.time() - entry.get('time', 0) > self.account_ttl:
+            return
+        info = entry.get('info')
+        if self.valid_account_info(info):
+            return info
+
+    def store_account_info(self, info: dict | None):
+        if not self.account_id:
+            return
+        with self._account_file_lock:
+            accounts = self._stored_accounts()
+            if info:
+                accounts[self.account_id] = {'info': info, 'time': time.time()}
+            else:
+                accounts.pop(self.account_id, None)
+            part_path = self.account_file.with_suffix('.part')
+            part_path.write_text(json.dumps(accounts))
+            part_path.replace(self.account_file)
 
     def request(self, url_suffix: str, data=None, files=None, **kwargs) -> dict | bytes:
+        if data or files or kwargs.get('action') not in self.single_flight_actions:
+            return self._request(url_suffix, data, files, **kwargs)
+
+        flight_key = (url_suffix, tuple(sorted(kwargs.items())))
+        with self._flight_lock:
+            flight = self._in_flight.get(flight_key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[flight_key] = [Future(), 0]
+            else:
+                flight[1] += 1
+        future = flight[0]
+        # Callers change the response in place (unescaping, artist stripping). When others joined, they get
+        # copies of an untouched copy the leader made before returning.
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = self._request(url_suffix, **kwargs)
+        except BaseException as e:
+            with self._flight_lock:
+                del self._in_flight[flight_key]
+            future.set_exception(e)
+            raise
+        with self._flight_lock:
+            del self._in_flight[flight_key]
+            followers = flight[1]
+        future.set_result(copy.deepcopy(result) if followers else None)
+        return result
+
+    def _request(self, url_suffix: str, data=None, files=None, **kwargs) -> dict | bytes:
         url = self.url + url_suffix + '.php'
         report.debug(f'{self.tr.name} {url_suffix} {kwargs}')
         req_method = 'POST' if data or files else 'GET'
 
-        self._rate_limit()
-        r = self.session.request(req_method, url, params=kwargs, data=data, files=files)
-        self.last_x_reqs.append(time.time())
-
-        try:
-            r_dict = r.json()
-        except JSONDecodeError:
-            if 'application/x-bittorrent' in r.headers['content-type']:
-                return r.content
+        headers = None
+        if files:
+            data = MultipartStream(data, files)
+            headers = {'Content-Type': data.content_type}
+
+        with self._send(req_method, url, params=kwargs, data=data, headers=headers, stream=True,
+                        timeout=self.upload_timeout if files else self.timeout) as r:
+            if r.status_code in (401, 403):
+                self.forget_account_info()
+                raise AuthFailure(f'{r.status_code} {r.reason}')
+            content_type = r.headers.get('Content-Type', '')
+            if content_type.startswith(self.binary_types):
+                return self.read_binary(r)
+            try:
+                r_dict = self.json_decoder(r.content)
+            except ValueError:
+                raise RequestFailure(f'no json, no torrent. {r.status_code} {content_type}')
+
+        status = r_dict.get('status')
+        if status == 'success':
+            return r_dict['response']
+        elif status == 'failure':
+            error = r_dict['error']
+            if any(e in str(error).lower() for e in self.auth_errors):
+                self.forget_account_info()
+                raise AuthFailure(error)
+            raise RequestFailure(error)
+
+        raise RequestFailure(r_dict)
+
+    def read_binary(self, r: requests.Response) -> bytes:
+        size = int(r.headers.get('Content-Length') or 0)
+        buf = bytearray(size)
+        filled = 0
+        for chunk in r.iter_content(self.chunk_size):
+            end = filled + len(chunk)
+            buf[filled:end] = chunk
+            filled = end
+        del buf[filled:]
+        return bytes(buf)
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        # only GETs are repeated after a response or a dropped connection. A POST
+        # (upload, torrentedit) may have been applied already, so it's only repeated
+        # when the connection was never made.
+        idempotent = method == 'GET'
+        attempt = 0
+        while True:
+            self._rate_limit()
+            r = error = None
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except requests.ConnectTimeout as e:
+                error = e
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not idempotent:
+                    raise
+                error = e
             else:
-                raise RequestFailure(f'no json, no torrent. {r.status_code}')
-        else:
-            status = r_dict.get('status')
-            if status == 'success':
-                return r_dict['response']
-            elif status == 'failure':
-                raise RequestFailure(r_dict['error'])
-
-            raise RequestFailure(r_dict)
+                if not idempotent or r.status_code not in self.retry_statuses:
+                    return r
+
+            if attempt == self.retries:
+                if error:
+                    raise error
+                return r
+            attempt += 1
+            delay = self.backoff * 2 ** attempt * random.uniform(.5, 1.5)
+            retry_after = r.headers.get('Retry-After', '') if r is not None else ''
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            if r is not None:
+                r.close()
+            report.debug(f'{self.tr.name} retry {attempt} in {delay:.1f}s')
+            time.sleep(delay)
 
     def torrent_info(self, **kwargs) -> TorrentInfo:
         r = self.request('torrent', **kwargs)
@@ -95,10 +284,15 @@ class BaseApi:
 
 
 class KeyApi(BaseApi):
+    # downloaded logs, reused when the same torrent is transplanted again. Safe to delete
+    riplog_dir = Path('riplogs')
+    riplog_max_age = 30 * 86400
+    riplog_max_files = 1000
 
     def authenticate(self, **kwargs):
         key = kwargs['key']
         self.session.headers.update({"Authorization": key})
+        self.account_id = f'{self.tr.name}_{sha256(key.encode()).hexdigest()}'
 
     def request(self, action: str, data=None, files=None, **kwargs):
         kwargs.update(action=action)
@@ -107,12 +301,45 @@ class KeyApi(BaseApi):
     def upl_response_handler(self, r):
         raise NotImplementedError
 
-    def get_riplog(self, tor_id: int, log_id: int):
+    def cached_riplog(self, tor_id: int, log_id: int) -> Path | None:
+        for p in self.riplog_dir.glob(f'{self.tr.name}_{tor_id}_{log_id}_*.log'):
+            with p.open('rb') as f:
+                if file_digest(f, 'sha256').hexdigest() == p.stem.rpartition('_')[2]:
+                    p.touch()
+                    return p
+            p.unlink()
+
+    def get_riplog(self, tor_id: int, log_id: int) -> Path:
+        if cached := self.cached_riplog(tor_id, log_id):
+            return cached
+
         r: dict = self.request('riplog', id=tor_id, logid=log_id)
         log_bytes = base64.b64decode(r['log'])
         log_checksum = sha256(log_bytes).hexdigest()
         assert log_checksum == r['log_sha256']
-        return log_bytes
+
+        self.riplog_dir.mkdir(exist_ok=True)
+        log_path = self.riplog_dir / f'{self.tr.name}_{tor_id}_{log_id}_{log_checksum}.log'
+        part_path = log_path.with_suffix('.part')
+        part_path.write_bytes(log_bytes)
+        part_path.replace(log_path)
+        return log_path
+
+    def get_riplogs(self, tor_id: int, log_ids: list[int]) -> list[Path]:
+        with ThreadPoolExecutor(max_workers=self.tr.req_limit) as executor:
+            log_paths = list(executor.map(partial(self.get_riplog, tor_id), log_ids))
+        self.prune_riplogs(keep=log_paths)
+        return log_paths
+
+    def prune_riplogs(self, keep: list[Path] = ()):
+        if not self.riplog_dir.is_dir():
+            return
+        now = time.time()
+        logs = sorted(((p.stat().st_mtime, p) for p in self.riplog_dir.glob('*.log') if p not in keep),
+                      reverse=True)
+        for i, (mtime, p) in enumerate(logs):
+            if i + len(keep) >= self.riplog_max_files or now - mtime > self.riplog_max_age:
+                p.unlink(missing_ok=True)
 
 
 class CookieApi(BaseApi):
@@ -166,7 +393,7 @@ class CookieApi(BaseApi):
 class HtmlApi(CookieApi):
 
     def get_account_info(self):
-        r = self.session.get(self.url + 'index.php')
+        r = self._send('GET', self.url + 'index.php', timeout=self.timeout)
         return {
             'authkey': re.search(r"authkey=(.+?)[^a-zA-Z0-9]", r.text).group(1),
             'passkey': re.search(r"passkey=(.+?)[^a-zA-Z0-9]", r.text).group(1),
@@ -178,8 +405,8 @@ class HtmlApi(CookieApi):
 
 
 class RedApi(KeyApi):
-    def __init__(self, key=None):
-        super().__init__(TR.RED, key=key)
+    def __init__(self, key=None, **kwargs):
+        super().__init__(TR.RED, key=key, **kwargs)
 
     def _uploader(self, data: dict, files: list) -> (int, int, str):
         try:
@@ -202,8 +429,8 @@ class RedApi(KeyApi):
 
 
 class OpsApi(KeyApi):
-    def __init__(self, key=None):
-        super().__init__(TR.OPS, key=f"token {key}")
+    def __init__(self, key=None, **kwargs):
+        super().__init__(TR.OPS, key=f"token {key}", **kwargs)
 
     def upl_response_handler(self, r):
         group_id = r.get('groupId')
@@ -217,3 +444,19 @@ def sleeve(trckr: TR, **kwargs) -> RedApi | OpsApi:
         TR.OPS: OpsApi
     }
     return api_map[trckr](**kwargs)
+
+
+_shared_apis: dict[tuple, RedApi | OpsApi] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_sleeve(trckr: TR, key: str, pool_size: int = None, timeout: tuple = None,
+                  retries: int = None) -> RedApi | OpsApi:
+    # one client per tracker, key and connection settings for the whole process, keeps sessions and rate limits shared
+    api_key = (trckr, key, pool_size, timeout and tuple(timeout), retries)
+    with _shared_lock:
+        api = _shared_apis.get(api_key)
+        if api is None:
+            api = _shared_apis[api_key] = sleeve(trckr, key=key, pool_size=pool_size, timeout=timeout,
+                                                 retries=retries)
+        return api
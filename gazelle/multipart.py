@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+from typing import Iterator
+
+Body = bytes | Path | list[bytes] | tuple[bytes, ...]
+
+
+class MultipartStream:
+    chunk_size = 2 ** 16
+
+    def __init__(self, data: dict | None, files: list):
+        self.boundary = os.urandom(16).hex()
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self._parts: list[tuple[bytes, Body]] = []
+
+        for name, value in (data or {}).items():
+            if isinstance(value, (str, bytes)) or not hasattr(value, '__iter__'):
+                value = [value]
+            for v in value:
+                if v is None:
+                    continue
+                if not isinstance(v, bytes):
+                    v = str(v).encode()
+                self._parts.append((self.part_header(name), v))
+
+        for name, (filename, content, mime) in files:
+            self._parts.append((self.part_header(name, filename, mime), content))
+
+        self._closing = f'--{self.boundary}--\r\n'.encode()
+
+    def part_header(self, name: str, filename: str = None, mime: str = None) -> bytes:
+        disposition = f'form-data; name="{self.quote(name)}"'
+        if filename:
+            disposition += f'; filename="{self.quote(filename)}"'
+        header = f'--{self.boundary}\r\nContent-Disposition: {disposition}\r\n'
+        if mime:
+            header += f'Content-Type: {mime}\r\n'
+
+        return (header + '\r\n').encode()
+
+    @staticmethod
+    def quote(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '%22')
+
+    @staticmethod
+    def body_size(body: Body) -> int:
+        if isinstance(body, Path):
+            return body.stat().st_size
+        if isinstance(body, bytes):
+            return len(body)
+        return sum(len(b) for b in body)
+
+    def __len__(self):
+        size = len(self._closing)
+        for header, body in self._parts:
+            size += len(header) + self.body_size(body) + 2
+
+        return size
+
+    def __iter__(self) -> Iterator[bytes]:
+        for header, body in self._parts:
+            yield header
+            if isinstance(body, Path):
+                with body.open('rb') as f:
+                    yield from iter(lambda: f.read(self.chunk_size), b'')
+            elif isinstance(body, bytes):
+                yield body
+            else:
+                yield from body
+            yield b'\r\n'
+
+        yield self._closing
@@ -36,17 +36,41 @@ FIELD_MAP = {
 ARTTIST_STRIP_REGEX = re.compile(r'(.+)\s\(\d+\)$')
 
 
+# fields that can hold html entities and are actually used by TorrentInfo
+UNEXAPE_FIELDS = {
+    'group': ('name', 'wikiImage', 'bbBody', 'recordLabel', 'catalogueNumber', 'tags', 'musicInfo'),
+    'torrent': ('remasterTitle', 'remasterRecordLabel', 'remasterCatalogueNumber', 'description', 'filePath',
+                'fileList', 'username'),
+}
+
+
 def unexape(thing: Any) -> Any:
-    if isinstance(thing, list):
-        for i, x in enumerate(thing):
-            thing[i] = unexape(x)
-    elif isinstance(thing, dict):
-        for k, v in thing.items():
-            thing[k] = unexape(v)
-    try:
-        return html.unescape(thing)
-    except TypeError:
-        return thing
+    if isinstance(thing, str):
+        return html.unescape(thing) if '&' in thing else thing
+
+    stack = [thing]
+    while stack:
+        container = stack.pop()
+        items = enumerate(container) if isinstance(container, list) else container.items()
+        for k, v in items:
+            if isinstance(v, str):
+                if '&' in v:
+                    container[k] = html.unescape(v)
+            elif isinstance(v, (list, dict)):
+                stack.append(v)
+
+    return thing
+
+
+def unexape_fields(tr_resp: dict) -> dict:
+    for sub_name, fields in UNEXAPE_FIELDS.items():
+        sub_dict = tr_resp[sub_name]
+        for field in fields:
+            value = sub_dict.get(field)
+            if isinstance(value, (str, list, dict)):
+                sub_dict[field] = unexape(value)
+
+    return tr_resp
 
 
 class TorrentInfo:
@@ -116,7 +140,7 @@ class TorrentInfo:
         self.artist_data = artists
 
     def set_red_info(self, tr_resp: dict):
-        tr_resp: dict = unexape(tr_resp)
+        tr_resp: dict = unexape_fields(tr_resp)
         self.set_common_gazelle(tr_resp)
 
         self.alb_descr = tr_resp['group']['bbBody']
@@ -1,5 +1,6 @@
 import logging
 from pathlib import Path
+from hashlib import sha256, file_digest
 from bcoding import bencode, bdecode
 from gazelle.tracker_data import TR, ReleaseType, ArtistType, Encoding
 from lib import tp_text
@@ -126,42 +127,76 @@ class Dtor:
         self.source = None
 
         if isinstance(tor, bytes):
-            self.t_info = bdecode(tor)['info']
-        elif isinstance(tor, dict):
-            self.t_info = tor['info']
+            tor = bdecode(tor)
         elif isinstance(tor, Path):
-            self.t_info = bdecode(tor.read_bytes())['info']
-        else:
+            tor = bdecode(tor.read_bytes())
+        elif not isinstance(tor, dict):
             raise TypeError
+        self.t_info = tor['info']
+        # v2 and hybrid torrents
+        self.piece_layers = tor.get('piece layers')
 
         if 'source' in self.t_info:
             del self.t_info['source']
 
-        self.lrm = False
-
-        self.stripped_info = self.t_info.copy()
-        self.stripped_info['name'] = self.t_info['name'].translate(uni_t_table)
-        for fd in self.stripped_info['files']:
-            p_elements: list = fd['path']
-            fd['path'] = [e.translate(uni_t_table) for e in p_elements]
-        if self.stripped_info != self.t_info:
-            self.lrm = True
+        stripped_info = self.t_info.copy()
+        stripped_info['name'] = self.t_info['name'].translate(uni_t_table)
+        if 'files' in self.t_info:
+            stripped_info['files'] = [{**fd, 'path': [e.translate(uni_t_table) for e in fd['path']]}
+                                      for fd in self.t_info['files']]
+        if 'file tree' in self.t_info:
+            stripped_info['file tree'] = self.strip_tree(self.t_info['file tree'])
+        self.lrm = stripped_info != self.t_info
+        self.stripped_info = stripped_info if self.lrm else self.t_info
+
+        # bencoded info, split around the 'source' key, so per destination only announce and source are encoded
+        self._encoded = {False: self.encode_info(self.t_info)}
+        if self.lrm:
+            self._encoded[True] = self.encode_info(self.stripped_info)
+        self._encoded_layers = bencode(self.piece_layers) if self.piece_layers else None
+
+    @classmethod
+    def strip_tree(cls, node: dict) -> dict:
+        return {k.translate(uni_t_table): v if k == '' else cls.strip_tree(v) for k, v in node.items()}
 
-    def as_bytes(self, u_strip=False):
-        return bencode(self.as_dict(u_strip))
+    @staticmethod
+    def encode_info(info: dict) -> tuple[bytes, bytes]:
+        before, after = [], []
+        for k in sorted(info):
+            (before if k < 'source' else after).append(bencode(k) + bencode(info[k]))
+        return b''.join(before), b''.join(after)
+
+    def as_bytes(self, u_strip=False) -> bytes:
+        return b''.join(self.byte_parts(u_strip))
+
+    def byte_parts(self, u_strip=False) -> list[bytes]:
+        before, after = self._encoded[self.lrm and u_strip]
+        parts = [b'd']
+        if self.announce:
+            parts += (b'8:announce', bencode(self.announce))
+        parts += (b'4:info', b'd', before)
+        if self.source:
+            parts += (b'6:source', bencode(self.source))
+        parts += (after, b'e')
+        if self._encoded_layers:
+            parts += (b'12:piece layers', self._encoded_layers)
+        parts.append(b'e')
+        return parts
 
     def as_dict(self, u_strip=False):
         tordict = {}
         if self.announce:
             tordict['announce'] = self.announce
         if not self.lrm or not u_strip:
-            info = self.t_info
+            info = self.t_info.copy()
         else:
-            info = self.stripped_info
+            info = self.stripped_info.copy()
         if self.source:
             info['source'] = self.source
 
         tordict['info'] = info
+        if self.piece_layers:
+            tordict['piece layers'] = self.piece_layers
         return tordict
 
     def trackerise(self, announce=None, source=None):
@@ -172,16 +207,19 @@ class Dtor:
 class Files:
     def __init__(self):
         self.dtors: list[Dtor] = []
-        self.logs: list[bytes] = []
+        self.logs: list[Path | bytes] = []
+        self._log_digests: set[bytes] = set()
 
     def add_log(self, log: Path | bytes):
         if isinstance(log, Path):
-            log = log.read_bytes()
+            with log.open('rb') as f:
+                digest = file_digest(f, 'sha256').digest()
         elif isinstance(log, bytes):
-            pass
+            digest = sha256(log).digest()
         else:
             raise TypeError
-        if log not in self.logs:
+        if digest not in self._log_digests:
+            self._log_digests.add(digest)
             self.logs.append(log)
 
     def add_dtor(self, dtor):
@@ -201,7 +239,7 @@ class Files:
         files = []
         for (field_name, i), dtor in zip(self.tor_field_names(), self.dtors):
             dtor.trackerise(announce, source)
-            files.append((field_name, (f'blabla{i}.torrent', dtor.as_bytes(u_strip), 'application/x-bittorrent')))
+            files.append((field_name, (f'blabla{i}.torrent', dtor.byte_parts(u_strip), 'application/x-bittorrent')))
 
         for log in self.logs:
             files.append(('logfiles[]', ('log.log', log, 'application/octet-stream')))
@@ -1,32 +1,110 @@
+import json
+import math
+import time
+import threading
 from enum import Enum, member
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+# race mode: seconds before giving up on all hosts, and before starting the next host
+RACE_DEADLINE = 30
+HEDGE_DELAY = 2
+
+STATS_PATH = Path('rehost_stats.json')
+
+# (connect, read) seconds. Hosts fetch the source image before answering, hence the long read
+TIMEOUT = (5, 45)
+
 
+def host_session() -> requests.Session:
+    # a rehost is cheap to repeat, but a read retry would double the wait, so only
+    # failed connects and gateway errors are retried
+    retry = Retry(total=2, connect=2, read=0, status=2, backoff_factor=.5,
+                  status_forcelist=(502, 503, 504), allowed_methods=None, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
 
-def ra_rehost(img_link, key):
+
+def ra_rehost(session, img_link, key):
     url = "https://thesungod.xyz/api/image/rehost_new"
     data = {'api_key': key,
             'link': img_link}
-    r = requests.post(url, data=data)
+    r = session.post(url, data=data, timeout=TIMEOUT)
     return r.json()['link']
 
 
-def ptpimg_rehost(img_link, key):
+def ptpimg_rehost(session, img_link, key):
     url = "https://ptpimg.me/"
     data = {'api_key': key,
             'link-upload': img_link}
-    r = requests.post(url + 'upload.php', data=data)
+    r = session.post(url + 'upload.php', data=data, timeout=TIMEOUT)
     rj = r.json()[0]
     return f"{url}{rj['code']}.{rj['ext']}"
 
 
-def imgbb_rehost(img_link, key):
+def imgbb_rehost(session, img_link, key):
     url = 'https://api.imgbb.com/1/upload'
     data = {'key': key,
             'image': img_link}
-    r = requests.post(url, data=data)
+    r = session.post(url, data=data, timeout=TIMEOUT)
     return r.json()['data']['url']
 
 
+class HostStats:
+    # Exponentially weighted averages of recent rehost attempts. Between attempts they drift back to the
+    # defaults, so a host that was down is tried again after a few hours.
+    weight = .3
+    default_latency = 5.
+    default_success = 1.
+    half_life = 2 * 3600
+
+    def __init__(self, latency: float = default_latency, success: float = default_success, attempts: int = 0,
+                 last: float = 0):
+        self.latency = latency
+        self.success = success
+        self.attempts = attempts
+        self.last = last
+        self._lock = threading.Lock()
+
+    def decayed(self) -> tuple[float, float]:
+        if not self.attempts:
+            return self.default_latency, self.default_success
+        d = .5 ** (max(time.time() - self.last, 0) / self.half_life)
+        return (self.default_latency + d * (self.latency - self.default_latency),
+                self.default_success + d * (self.success - self.default_success))
+
+    def record(self, seconds: float, ok: bool):
+        with self._lock:
+            self.latency, self.success = self.decayed()
+            w = self.weight if self.attempts else 1
+            self.latency += w * (seconds - self.latency)
+            self.success += w * (ok - self.success)
+            self.attempts += 1
+            self.last = time.time()
+
+    @property
+    def expected_time(self) -> float:
+        # time to success if failures were retried
+        latency, success = self.decayed()
+        return max(latency, 1.) / max(success, .05)
+
+    def as_list(self) -> list:
+        return [self.latency, self.success, self.attempts, self.last]
+
+    def __str__(self):
+        if not self.attempts:
+            return ''
+        latency, success = self.decayed()
+        return f'{latency:.1f}s, {success:.0%} ok'
+
+
 class IH(Enum):
     Ra = member(ra_rehost)
     PTPimg = member(ptpimg_rehost)
@@ -42,6 +120,9 @@ class IH(Enum):
         self.enabled = False
         self.prio = self.value
         self.func = func
+        self.stats = HostStats()
+        self._session = None
+        self._session_lock = threading.Lock()
 
     @property
     def key(self):
@@ -51,6 +132,13 @@ class IH(Enum):
     def key(self, key: str):
         self._key = key.strip()
 
+    @property
+    def session(self) -> requests.Session:
+        with self._session_lock:
+            if self._session is None:
+                self._session = host_session()
+            return self._session
+
     def extra_attrs(self):
         return self.enabled, self.key, self.prio
 
@@ -73,6 +161,128 @@ class IH(Enum):
             attr_dict[mem.name] = mem.extra_attrs()
         return attr_dict
 
+    def rehost(self, img_link: str) -> str:
+        start = time.monotonic()
+        try:
+            rehosted = self.func(self.session, img_link, self.key)
+        except Exception:
+            self.stats.record(time.monotonic() - start, False)
+            raise
+        self.stats.record(time.monotonic() - start, True)
+        return rehosted
+
     @classmethod
-    def prioritised(cls) -> list:
+    def prioritised(cls, adaptive=False) -> list:
+        if adaptive:
+            # hosts within about a factor 2 of each other count as equal, so the user's priority decides
+            return sorted(cls, key=lambda m: (round(math.log2(m.stats.expected_time)), m.prio))
         return sorted(cls, key=lambda m: m.prio)
+
+    @classmethod
+    def load_stats(cls, path: Path = STATS_PATH):
+        try:
+            stats = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            return
+        for name, values in stats.items():
+            if name in cls.__members__:
+                cls[name].stats = HostStats(*values)
+
+    @classmethod
+    def save_stats(cls, path: Path = STATS_PATH):
+        path.write_text(json.dumps({mem.name: mem.stats.as_list() for mem in cls}))
+
+
+class RehostCache:
+    def __init__(self, path: Path = Path('rehost_cache.json'), max_age_days: float = 180, max_entries: int = 2000):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: dict[str, list] | None = None  # src url: [rehosted url, host name, timestamp]
+
+    @property
+    def entries(self) -> dict[str, list]:
+        if self._entries is None:
+            try:
+                self._entries = json.loads(self.path.read_text())
+            except (FileNotFoundError, ValueError):
+                self._entries = {}
+            self.evict()
+        return self._entries
+
+    def get(self, src_url: str) -> tuple[str, str] | None:
+        with self._lock:
+            entry = self.entries.get(src_url)
+            if not entry:
+                return None
+            if time.time() - entry[2] > self.max_age or entry[1] not in IH.__members__:
+                del self.entries[src_url]
+                return None
+            # urls of a disabled host are kept, in case it's enabled again
+            if not IH[entry[1]].enabled:
+                return None
+            return entry[0], entry[1]
+
+    def put(self, src_url: str, rehosted_url: str, host: IH):
+        with self._lock:
+            self.entries[src_url] = [rehosted_url, host.name, time.time()]
+            self.evict()
+            self.save()
+
+    def evict(self):
+        now = time.time()
+        entries = {k: v for k, v in self._entries.items() if now - v[2] <= self.max_age}
+        if len(entries) > self.max_entries:
+            newest = sorted(entries.items(), key=lambda kv: kv[1][2])[-self.max_entries:]
+            entries = dict(newest)
+        self._entries = entries
+
+    def save(self):
+        tmp_path = self.path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(self._entries))
+        tmp_path.replace(self.path)
+
+
+def race_rehost(hosts: list[IH], img_link: str, deadline: float = RACE_DEADLINE,
+                hedge_delay: float = HEDGE_DELAY) -> tuple[IH, str] | None:
+    # Host n is started after n * hedge_delay, or sooner when all hosts before it failed.
+    # A success is only taken when all higher priority hosts have failed, until the deadline passes.
+    executor = ThreadPoolExecutor(max_workers=len(hosts) or 1)
+    futures: dict[IH, Future] = {}
+    start = time.monotonic()
+
+    def succeeded(h: IH) -> bool:
+        f = futures.get(h)
+        return bool(f) and f.done() and f.exception() is None
+
+    try:
+        while True:
+            now = time.monotonic() - start
+            earlier_failed = True
+            for i, host in enumerate(hosts):
+                if host not in futures and (earlier_failed or now >= i * hedge_delay):
+                    futures[host] = executor.submit(host.rehost, img_link)
+                f = futures.get(host)
+                earlier_failed = earlier_failed and bool(f) and f.done() and f.exception() is not None
+
+            for host in hosts:
+                f = futures.get(host)
+                if not f or not f.done():
+                    break
+                if f.exception() is None:
+                    return host, f.result()
+            else:
+                return None
+
+            if now >= deadline:
+                for host in hosts:
+                    if succeeded(host):
+                        return host, futures[host].result()
+                return None
+
+            next_start = min((i * hedge_delay for i, h in enumerate(hosts) if h not in futures), default=deadline)
+            pending = [f for f in futures.values() if not f.done()]
+            wait(pending, timeout=max(min(next_start, deadline) - now, 0), return_when=FIRST_COMPLETED)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
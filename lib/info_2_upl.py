@@ -1,9 +1,10 @@
 import re
 import logging
-from typing import Iterable
+from typing import Iterable, Callable
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, Future
 
-from lib.img_rehost import IH
+from lib.img_rehost import IH, RehostCache, race_rehost
 from lib import utils, tp_text
 from gazelle.upload import UploadData
 from gazelle.tracker_data import ReleaseType
@@ -24,6 +25,8 @@ class TorInfo2UplData:
                  rel_descr_own_templ: str,
                  add_src_descr: bool,
                  src_descr_templ: str,
+                 rehost_race: bool = False,
+                 rehost_adaptive: bool = False,
                  ):
         self.rehost_img = rehost_img
         self.whitelist = whitelist
@@ -31,6 +34,20 @@ class TorInfo2UplData:
         self.rel_descr_own_templ = rel_descr_own_templ
         self.add_src_descr = add_src_descr
         self.src_descr_templ = src_descr_templ
+        self.rehost_race = rehost_race
+        self.rehost_adaptive = rehost_adaptive
+        self.rehost_cache = RehostCache()
+        IH.load_stats()
+        self._img_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rehost')
+        self._img_task: tuple[TorrentInfo, Future, list] | None = None
+
+    def prefetch_img(self, tor_info: TorrentInfo, dest_group: int):
+        # the worker's log messages are held back until do_img, so they don't end up between the job's own lines
+        if self.rehost_img and not dest_group:
+            messages = []
+            future = self._img_executor.submit(self.img_url, tor_info.img_url,
+                                               lambda lvl, msg: messages.append((lvl, msg)))
+            self._img_task = tor_info, future, messages
 
     def field_gen(self, dest_grp):
         if not dest_grp:
@@ -107,33 +124,59 @@ class TorInfo2UplData:
         u_data.tags = tag_string
 
     def do_img(self, tor_info, u_data):
-        src_img_url = tor_info.img_url
+        task, self._img_task = self._img_task, None
+        if not task or task[0] is not tor_info:
+            u_data.upl_img_url = self.img_url(tor_info.img_url)
+            return
+
+        _, future, messages = task
+        try:
+            u_data.upl_img_url = future.result()
+        finally:
+            for lvl, msg in messages:
+                report.log(lvl, msg)
 
-        report.info(tp_text.rehost)
+    def img_url(self, src_img_url: str, log: Callable[[int, str], None] = report.log) -> str | None:
+        log(20, tp_text.rehost)
         if not src_img_url:
-            report.log(32, tp_text.no_img)
+            log(32, tp_text.no_img)
             return
 
         if any(w in src_img_url for w in self.whitelist):
-            u_data.upl_img_url = src_img_url
-            report.log(22, tp_text.img_white)
-            return
+            log(22, tp_text.img_white)
+            return src_img_url
+
+        return self.rehost(src_img_url, log) or src_img_url
+
+    def rehost(self, src_img_url: str, log: Callable[[int, str], None]):
+        if cached := self.rehost_cache.get(src_img_url):
+            rehosted_img, host_name = cached
+            log(22, f'{tp_text.rehost_cached} {host_name}: {rehosted_img}')
+            return rehosted_img
+
+        log(22, tp_text.trying)
+        hosts = [h for h in IH.prioritised(self.rehost_adaptive) if h.enabled]
+        if self.rehost_race:
+            found = race_rehost(hosts, src_img_url)
+            if found:
+                log(22, f'{found[0].name}...')
+        else:
+            found = self.serial_rehost(hosts, src_img_url, log)
+        IH.save_stats()
 
-        u_data.upl_img_url = self.rehost(src_img_url) or src_img_url
+        if found:
+            host, rehosted_img = found
+            log(22, rehosted_img)
+            self.rehost_cache.put(src_img_url, rehosted_img, host)
+            return rehosted_img
+
+        log(32, tp_text.rehost_failed)
 
     @staticmethod
-    def rehost(src_img_url: str):
-        report.log(22, tp_text.trying)
-        for host in IH.prioritised():
-            if not host.enabled:
-                continue
-            report.log(22, f'{host.name}...')
+    def serial_rehost(hosts: list[IH], src_img_url: str, log: Callable[[int, str], None]) -> tuple[IH, str] | None:
+        for host in hosts:
+            log(22, f'{host.name}...')
             try:
-                rehosted_img = host.func(src_img_url, host.key)
+                return host, host.rehost(src_img_url)
             except Exception:
                 continue
-            else:
-                report.log(22, rehosted_img)
-                return rehosted_img
-
-        report.log(32, tp_text.rehost_failed)
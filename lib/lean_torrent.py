@@ -1,19 +1,169 @@
+import os
 import math
-from hashlib import sha1
+import time
+import queue
+import threading
+from hashlib import sha1, sha256
+from collections import deque
 from pathlib import Path
+from typing import Callable
 from multiprocessing import pool
 
-from lib.utils import scantree
+from lib.utils import scantree, uni_t_table
+
+# max size of piece data that is read but not yet hashed
+BUFFER_MB = 64
+# size of a single read call, smaller pieces are read several at a time
+BLOCK_SIZE = 2 ** 22
+# nr of read buffers that can wait for a hash worker
+READ_AHEAD = 8
+# min seconds between progress callbacks
+PROGRESS_INTERVAL = 5
+# v2 merkle tree leaf size
+V2_BLOCK = 2 ** 14
+
+_hash_pool: pool.ThreadPool | None = None
+_hash_pool_lock = threading.Lock()
+
+
+class HashingCancelled(Exception):
+    pass
+
+
+def hash_pool() -> pool.ThreadPool:
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = pool.ThreadPool(os.cpu_count() or 1)
+        return _hash_pool
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.close()
+            _hash_pool.join()
+            _hash_pool = None
+
+
+def merkle_root(hashes: list[bytes], width: int, pad_hash: bytes = bytes(32)) -> bytes:
+    layer = hashes + [pad_hash] * (width - len(hashes))
+    while len(layer) > 1:
+        layer = [sha256(layer[i] + layer[i + 1]).digest() for i in range(0, len(layer), 2)]
+    return layer[0]
+
+
+def next_pow2(n: int) -> int:
+    return 1 << max(n - 1, 0).bit_length()
+
+
+class DeviceStats:
+    # bytes read and seconds spent hashing, per device
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: dict[int, list] = {}
+
+    def record(self, dev: int, path: Path, n_bytes: int, seconds: float):
+        with self._lock:
+            stats = self._stats.setdefault(dev, [path, 0, .0])
+            stats[1] += n_bytes
+            stats[2] += seconds
+
+    def pop_stats(self) -> dict[int, tuple[Path, int, float]]:
+        with self._lock:
+            stats, self._stats = self._stats, {}
+        return {dev: tuple(s) for dev, s in stats.items()}
+
+
+device_stats = DeviceStats()
+
+
+class IoThrottle:
+    def __init__(self, mb_per_s: float = 0, iops: float = 0):
+        self.bytes_per_s = mb_per_s * 2 ** 20
+        self.iops = iops
+        self.start = None
+        self.bytes = 0
+        self.ops = 0
+
+    def __bool__(self):
+        return bool(self.bytes_per_s or self.iops)
+
+    def wait(self, n: int, stop: threading.Event):
+        if self.start is None:
+            self.start = time.monotonic()
+        self.bytes += n
+        self.ops += 1
+        due = max(self.bytes / self.bytes_per_s if self.bytes_per_s else 0,
+                  self.ops / self.iops if self.iops else 0)
+        delay = due - (time.monotonic() - self.start)
+        if delay > 0:
+            stop.wait(delay)
+
+
+class HashProgress:
+    def __init__(self, total_bytes: int, total_pieces: int):
+        self.total_bytes = total_bytes
+        self.total_pieces = total_pieces
+        self.bytes_read = 0
+        self.pieces_hashed = 0
+        # hashing side waiting for the reader (I/O bound)
+        self.read_wait = .0
+        # reader waiting for free buffers (CPU bound)
+        self.hash_wait = .0
+        self.start = time.monotonic()
+        self.done = False
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.bytes_read / 2 ** 20 / (self.elapsed or 1e-9)
+
+    @property
+    def eta(self) -> float | None:
+        if not self.bytes_read:
+            return None
+        return (self.total_bytes - self.bytes_read) / (self.bytes_read / (self.elapsed or 1e-9))
+
+    @property
+    def percentage(self) -> float:
+        return self.pieces_hashed / (self.total_pieces or 1) * 100
 
 
 class Torrent:
-    def __init__(self, path: Path):
+    def __init__(self, path: Path, buffer_mb: int = BUFFER_MB, block_size: int = BLOCK_SIZE,
+                 read_ahead: int = READ_AHEAD, fadvise: bool = False, max_mb_per_s: float = 0, max_iops: float = 0,
+                 progress_callback: Callable[[HashProgress], None] | None = None,
+                 cancel: threading.Event | None = None, v1: bool = True, v2: bool = False,
+                 prev_info: dict | None = None, prev_time: float | None = None):
+        assert v1 or v2
         self.path = path
+        self.v1 = v1
+        self.v2 = v2
+        self.buffer_mb = buffer_mb
+        self.block_size = block_size
+        self.read_ahead = read_ahead
+        # hint sequential reads and drop hashed data from the page cache (posix only)
+        self.fadvise = fadvise and hasattr(os, 'posix_fadvise')
+        self.throttle = IoThrottle(max_mb_per_s, max_iops)
+        self.progress_callback = progress_callback
+        self.progress: HashProgress | None = None
+        self.cancel = cancel or threading.Event()
+        # v1 info of a previous torrent of (nearly) the same folder, made at prev_time. Its piece hashes are
+        # reused up to the first file that differs in path or size, or was modified after prev_time.
+        # Only the first and last piece of each reused file is hashed as a sample check.
+        self.prev_info = prev_info if v1 and not v2 and prev_info and 'files' in prev_info and prev_time else None
+        self.prev_time = prev_time
+        self.reused_pieces = 0
+        self.bytes_skipped = 0
         self._file_list = []
         self._total_size = 0
         self._piece_size = None
         self.data = None
-        self._pool = pool.ThreadPool()
         self.generate_data()
 
     def scan_files(self):
@@ -22,6 +172,11 @@ class Torrent:
                 fsize = p.stat().st_size
                 self._total_size += fsize
                 self._file_list.append((p, fsize))
+            if self.v2:
+                # v1 file order of hybrids must match the (bencode sorted) v2 file tree
+                self._file_list.sort(key=lambda x: [part.encode() for part in x[0].relative_to(self.path).parts])
+            elif self.prev_info:
+                self._file_list.sort(key=self.prev_order())
 
     @property
     def file_list(self) -> list[tuple[Path, int]]:
@@ -37,6 +192,8 @@ class Torrent:
 
     @property
     def piece_size(self):
+        if not self._piece_size and self.prev_info:
+            self._piece_size = self.prev_info['piece length']
         if not self._piece_size:
             min_piece_size = 2 ** 14
             max_piece_size = 2 ** 26
@@ -50,52 +207,302 @@ class Torrent:
 
         return self._piece_size
 
-    def file_objects(self):
-        for path, _ in self.file_list:
-            with path.open('rb') as f:
-                yield f
+    def rel_key(self, parts) -> tuple:
+        return tuple(part.translate(uni_t_table) for part in parts)
+
+    def prev_order(self) -> Callable:
+        # files of the previous torrent first, in its order. New files after that
+        prev_index = {self.rel_key(fd['path']): i for i, fd in enumerate(self.prev_info['files'])}
+        last = len(prev_index)
+        return lambda x: prev_index.get(self.rel_key(x[0].relative_to(self.path).parts), last)
+
+    def plan_reuse(self):
+        ps = self.piece_size
+        prev_files = self.prev_info['files']
+        offset = 0
+        file_starts = []
+        for i, (path, size) in enumerate(self.file_list):
+            if i >= len(prev_files):
+                break
+            fd = prev_files[i]
+            if fd['length'] != size or self.rel_key(fd['path']) != self.rel_key(path.relative_to(self.path).parts):
+                break
+            if path.stat().st_mtime > self.prev_time:
+                break
+            if size:
+                file_starts.append((offset, size))
+            offset += size
+
+        reusable = min(offset // ps, len(self.prev_info['pieces']) // 20)
+
+        # Spot check the first and last piece of every reused file, a retagged file changes size only sometimes
+        check = sorted({p for start, size in file_starts for p in (start // ps, (start + size - 1) // ps)
+                        if p < reusable})
+        for index in check:
+            if self.cancel.is_set():
+                raise HashingCancelled
+            if sha1(self.read_piece(index)).digest() != self.prev_info['pieces'][index * 20:index * 20 + 20]:
+                reusable = index
+                break
 
-    def file_chunks(self):
+        self.reused_pieces = reusable
+        self.bytes_skipped = max(reusable * ps - len(check) * ps, 0)
+
+    def read_piece(self, index: int) -> bytes:
         ps = self.piece_size
-        read_size = ps
+        offset = index * ps
         chunks = []
-        chunks_size = 0
-        for f in self.file_objects():
-            for chunk in iter(lambda: f.read(read_size), b''):
-                chunks_size += len(chunk)
-                chunks.append(chunk)
-                if chunks_size == ps:
-                    yield chunks
-                    chunks_size = 0
-                    read_size = ps
-                    chunks = []
-                else:
-                    read_size = ps - chunks_size
-        if chunks_size:
-            yield chunks
+        remaining = ps
+        for f in self.file_objects(offset):
+            chunk = f.read(remaining)
+            if self.throttle:
+                self.throttle.wait(len(chunk), self.cancel)
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            if not remaining:
+                break
+        return b''.join(chunks)
+
+    def file_objects(self, offset: int = 0):
+        for path, size in self.file_list:
+            if offset and offset >= size:
+                offset -= size
+                continue
+            with path.open('rb', buffering=0) as f:
+                if self.fadvise:
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                if offset:
+                    f.seek(offset)
+                    offset = 0
+                yield f
+
+    @property
+    def buffer_size(self) -> int:
+        # whole pieces, as many as fit in one block
+        return self.piece_size * max(1, self.block_size // self.piece_size)
+
+    @property
+    def buffer_count(self) -> int:
+        # at least 2, so reading and hashing can overlap
+        return max(2, self.buffer_mb * 2 ** 20 // self.buffer_size)
+
+    @property
+    def piece_count(self) -> int:
+        ps = self.piece_size
+        if self.v2:
+            return sum(math.ceil(size / ps) for _, size in self.file_list)
+        return math.ceil(self.total_size / ps)
+
+    def piece_buffers(self, free: queue.Queue, stop: threading.Event):
+        # Yields (buffer, [(start, length, file_index), ...]). A buffer holds one or more pieces, or one
+        # piece read in several blocks. v2 and hybrid pieces are aligned to file boundaries.
+        ps = self.piece_size
+        buf = None
+        pieces = []
+        filled = piece_start = 0
+        for file_index, f in enumerate(self.file_objects(self.reused_pieces * ps)):
+            while True:
+                if buf is None:
+                    wait_start = time.monotonic()
+                    while True:
+                        try:
+                            buf = free.get(timeout=.1)
+                            break
+                        except queue.Empty:
+                            if stop.is_set():
+                                return
+                    self.progress.hash_wait += time.monotonic() - wait_start
+                    view = memoryview(buf)
+                    pieces = []
+                    filled = piece_start = 0
+                n = self.read_block(f, view[filled:min(filled + self.block_size, len(buf))], stop)
+                if not n:
+                    break
+                filled += n
+                while filled - piece_start >= ps:
+                    pieces.append((piece_start, ps, file_index))
+                    piece_start += ps
+                if filled == len(buf):
+                    yield buf, pieces
+                    buf = None
+            if self.v2 and buf is not None and filled > piece_start:
+                pieces.append((piece_start, filled - piece_start, file_index))
+                piece_start += ps
+                filled = piece_start
+                if filled == len(buf):
+                    yield buf, pieces
+                    buf = None
+        if buf is not None:
+            if filled > piece_start:
+                pieces.append((piece_start, filled - piece_start, file_index))
+            if pieces:
+                yield buf, pieces
+
+    def read_block(self, f, view: memoryview, stop: threading.Event) -> int:
+        n = f.readinto(view)
+        self.progress.bytes_read += n
+        if self.throttle:
+            self.throttle.wait(n, stop)
+        if n and self.fadvise:
+            os.posix_fadvise(f.fileno(), f.tell() - n, n, os.POSIX_FADV_DONTNEED)
+        return n
 
     @staticmethod
-    def list_hasher(chunks: list[bytes]):
-        h = sha1()
-        for chunk in chunks:
-            h.update(chunk)
-        return h.digest()
+    def put_unless_stopped(q: queue.Queue, item, stop: threading.Event) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader(self, free: queue.Queue, ready: queue.Queue, stop: threading.Event):
+        try:
+            for item in self.piece_buffers(free, stop):
+                if not self.put_unless_stopped(ready, item, stop):
+                    return
+        except Exception as e:
+            self.put_unless_stopped(ready, e, stop)
+        else:
+            self.put_unless_stopped(ready, None, stop)
+
+    def buffer_hasher(self, buf: bytearray, pieces: list[tuple[int, int, int]],
+                      free: queue.Queue) -> list[tuple[bytes | None, bytes | None]]:
+        view = memoryview(buf)
+        hashes = [self.piece_hasher(view[start:start + length], file_index) for start, length, file_index in pieces]
+        free.put(buf)
+        return hashes
+
+    def piece_hasher(self, view: memoryview, file_index: int) -> tuple[bytes | None, bytes | None]:
+        ps = self.piece_size
+        length = len(view)
+        v1_hash = v2_hash = None
+        if self.v1:
+            h = sha1(view)
+            # hybrid: pad files fill up the last piece of every file
+            if self.v2 and length < ps:
+                h.update(bytes(ps - length))
+            v1_hash = h.digest()
+        if self.v2:
+            leaves = [sha256(view[i:i + V2_BLOCK]).digest() for i in range(0, length, V2_BLOCK)]
+            if self.file_list[file_index][1] > ps:
+                width = ps // V2_BLOCK
+            else:
+                width = next_pow2(len(leaves))
+            v2_hash = merkle_root(leaves, width)
+        return v1_hash, v2_hash
+
+    def get_unless_cancelled(self, q: queue.Queue):
+        while True:
+            if self.cancel.is_set():
+                raise HashingCancelled
+            try:
+                return q.get(timeout=.1)
+            except queue.Empty:
+                continue
 
     def file_hashes(self):
-        for chsum in self._pool.imap(self.list_hasher, self.file_chunks(), 10):
-            yield chsum
+        skipped = self.reused_pieces * self.piece_size
+        self.progress = HashProgress(self.total_size - skipped, self.piece_count - self.reused_pieces)
+        # A read-ahead thread fills preallocated buffers while the pool hashes earlier ones.
+        # Buffers go back to the reader after hashing, so the reader blocks when the workers fall behind.
+        free = queue.Queue()
+        for _ in range(self.buffer_count):
+            free.put(bytearray(self.buffer_size))
+        ready = queue.Queue(maxsize=self.read_ahead)
+        stop = threading.Event()
+        reader = threading.Thread(target=self.reader, args=(free, ready, stop), daemon=True)
+        reader.start()
+
+        hasher_pool = hash_pool()
+        pending = deque()
+        progress = self.progress
+        last_report = time.monotonic()
+        try:
+            while True:
+                wait_start = time.monotonic()
+                item = self.get_unless_cancelled(ready)
+                progress.read_wait += time.monotonic() - wait_start
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                pending.append(hasher_pool.apply_async(self.buffer_hasher, (*item, free)))
+                while pending and pending[0].ready():
+                    hashes = pending.popleft().get()
+                    progress.pieces_hashed += len(hashes)
+                    yield from hashes
+
+                if self.progress_callback and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    self.progress_callback(progress)
+
+            while pending:
+                hashes = pending.popleft().get()
+                progress.pieces_hashed += len(hashes)
+                yield from hashes
+
+            progress.done = True
+            if self.progress_callback:
+                self.progress_callback(progress)
+        finally:
+            stop.set()
+            reader.join()
 
     def generate_data(self):
+        start = time.monotonic()
+        if self.prev_info:
+            self.plan_reuse()
+        hashes = list(self.file_hashes())
+        device_stats.record(self.path.stat().st_dev, self.path, self.progress.bytes_read, time.monotonic() - start)
+
         info = {
-            'files': [],
             'name': self.path.name,
-            'pieces': b''.join(self.file_hashes()),
             'piece length': self.piece_size,
             'private': 1
         }
+        self.data = {'info': info}
+        if self.v1:
+            reused = self.prev_info['pieces'][:self.reused_pieces * 20] if self.reused_pieces else b''
+            info['pieces'] = reused + b''.join(v1_hash for v1_hash, _ in hashes)
+            info['files'] = self.v1_files()
+        if self.v2:
+            info['meta version'] = 2
+            info['file tree'], self.data['piece layers'] = self.v2_tree([v2_hash for _, v2_hash in hashes])
+
+    def v1_files(self) -> list[dict]:
+        files = []
         for path, size in self.file_list:
             fx = {'length': size,
                   'path': path.relative_to(self.path).parts}
-            info['files'].append(fx)
+            files.append(fx)
 
-        self.data = {'info': info}
+            pad = -size % self.piece_size
+            if self.v2 and pad:
+                files.append({'attr': 'p', 'length': pad, 'path': ['.pad', str(pad)]})
+        return files
+
+    def v2_tree(self, piece_hashes: list[bytes]) -> tuple[dict, dict]:
+        ps = self.piece_size
+        pad_hash = merkle_root([], ps // V2_BLOCK)
+        file_tree = {}
+        piece_layers = {}
+        hash_iter = iter(piece_hashes)
+        for path, size in self.file_list:
+            node = file_tree
+            for part in path.relative_to(self.path).parts:
+                node = node.setdefault(part, {})
+            node[''] = {'length': size}
+            if not size:
+                continue
+
+            if size <= ps:
+                root = next(hash_iter)
+            else:
+                layer = [next(hash_iter) for _ in range(math.ceil(size / ps))]
+                root = merkle_root(layer, next_pow2(len(layer)), pad_hash)
+                piece_layers[root] = b''.join(layer)
+            node['']['pieces root'] = root
+
+        return file_tree, piece_layers
@@ -15,13 +15,21 @@ missing = "Can't find:"
 no_log = "No logs found"
 log_count_wrong = 'Torrent has {} logs, {} found'
 new_tor = 'Generating new torrent'
+hash_progress = 'Hashing: {:.0f}%, ETA {}'
+hash_done = 'Hashing done'
+hash_reused = 'Reused {} pieces from source torrent after a sample check, {:.0f} MB not read'
+hash_stats = ('{}/{} pieces, {:.0f} MB read, {:.1f} MB/s, '
+              'waited {:.1f}s on reads, {:.1f}s on hashing')
+hash_throughput = 'Hashed on device {} ({}): {:.0f} MB in {:.1f}s, {:.1f} MB/s'
 tor_downed = '.torrent downloaded from {}'
 f_checked = 'Files checked'
 rehost = 'Img rehost:'
 no_img = 'No img in source'
 img_white = 'source img whitelisted'
 trying = 'trying'
+rehost_cached = 'cached from'
 rehost_failed = "Failed. Using source url"
+stopped = 'Stopped'
 permission_error = 'Permission error. Folder skipped: '
 # post check
 log_score_dif = 'Log scores different: {} - {}'
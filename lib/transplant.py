@@ -1,4 +1,5 @@
 import logging
+import threading
 from pathlib import Path
 from hashlib import sha1
 from typing import Iterator
@@ -8,11 +9,11 @@ from bcoding import bencode, bdecode
 
 from gazelle import upload
 from gazelle.tracker_data import TR, Encoding, BAD_RED_ENCODINGS, ArtistType
-from gazelle.api_classes import sleeve, BaseApi, OpsApi
+from gazelle.api_classes import shared_sleeve, BaseApi, OpsApi
 from gazelle.torrent_info import TorrentInfo
 from lib import utils, tp_text
 from lib.info_2_upl import TorInfo2UplData
-from lib.lean_torrent import Torrent
+from lib.lean_torrent import Torrent, HashProgress, HashingCancelled, device_stats
 
 report = logging.getLogger('tr.core')
 
@@ -106,9 +107,13 @@ class Job:
 class Transplanter:
     def __init__(self, key_dict, data_dir=None, deep_search=False, deep_search_level=None, dtor_save_dir=None,
                  save_dtors=False, del_dtors=False, file_check=True, rel_descr_templ=None, rel_descr_own_templ=None,
-                 add_src_descr=True, src_descr_templ=None, img_rehost=False, whitelist=None, post_compare=False):
+                 add_src_descr=True, src_descr_templ=None, img_rehost=False, whitelist=None, post_compare=False,
+                 drop_page_cache=False, io_limit_mb=0, io_limit_iops=0, stop_event=None, rehost_race=False,
+                 rehost_adaptive=False, reuse_hashes=False, api_pool_size=None, api_timeout=None,
+                 api_retries=None):
 
-        self.api_map = {trckr: sleeve(trckr, key=key_dict[trckr]) for trckr in TR}
+        self.key_dict = key_dict
+        self.api_settings = {'pool_size': api_pool_size, 'timeout': api_timeout, 'retries': api_retries}
         self.data_dir: Path = data_dir
         self.deep_search = deep_search
         self.deep_search_level = deep_search_level
@@ -117,13 +122,18 @@ class Transplanter:
         self.del_dtors = del_dtors
         self.file_check = file_check
         self.post_compare = post_compare
+        self.drop_page_cache = drop_page_cache
+        self.io_limit_mb = io_limit_mb
+        self.io_limit_iops = io_limit_iops
+        self.reuse_hashes = reuse_hashes
+        self.stop_event: threading.Event = stop_event or threading.Event()
 
         if self.deep_search:
             self.subdir_store = {}
             self.subdir_gen = subdirs_gen(self.data_dir, maxlevel=self.deep_search_level)
 
         self.inf_2_upl = TorInfo2UplData(img_rehost, whitelist, rel_descr_templ, rel_descr_own_templ,
-                                         add_src_descr, src_descr_templ)
+                                         add_src_descr, src_descr_templ, rehost_race, rehost_adaptive)
         self.job = None
         self.tor_info: TorrentInfo | None = None
         self._torrent_folder_path = None
@@ -136,7 +146,7 @@ class Transplanter:
 
         report.info(f"{self.job.src_tr.name} {self.job.display_name or self.job.tor_id}")
 
-        src_api = self.api_map[self.job.src_tr]
+        src_api = self.api(self.job.src_tr)
         if not self.get_torinfo(src_api):
             return False
 
@@ -147,17 +157,23 @@ class Transplanter:
         if self.fail_conditions():
             return False
 
+        self.inf_2_upl.prefetch_img(self.tor_info, self.job.dest_group)
+
         upl_files = upload.Files()
 
         if (self.tor_info.haslog or self.job.new_dtor) and not self.get_logs(upl_files, src_api):
             return False
+        try:
+            self.get_dtor(upl_files, src_api)
+        except HashingCancelled:
+            report.warning(tp_text.stopped)
+            return False
         upl_data = self.inf_2_upl.translate(self.tor_info, src_api.account_info['id'], self.job.dest_group)
-        self.get_dtor(upl_files, src_api)
 
         saul_goodman = True
         for dest_tr in self.job.dest_trs:
 
-            dest_api = self.api_map[dest_tr]
+            dest_api = self.api(dest_tr)
             data_dict = upl_data.upl_dict(dest_tr, self.job.dest_group)
 
             files_list = upl_files.files_list(dest_api.announce, dest_tr.name, u_strip=self.strip_tor)
@@ -187,6 +203,9 @@ class Transplanter:
 
         return True
 
+    def api(self, trckr: TR) -> BaseApi:
+        return shared_sleeve(trckr, self.key_dict[trckr], **self.api_settings)
+
     def reset(self):
         self.tor_info = None
         self._torrent_folder_path = None
@@ -338,8 +357,8 @@ class Transplanter:
             return True  # new torrent may have no log while original had one
 
         elif not self.file_check and self.tor_info.log_ids:
-            for i in self.tor_info.log_ids:
-                files.add_log(src_api.get_riplog(self.tor_info.tor_id, i))
+            for log_path in src_api.get_riplogs(self.tor_info.tor_id, self.tor_info.log_ids):
+                files.add_log(log_path)
         else:
             for p in self.tor_info.glob('*.log'):
                 if not self.is_riplog(p.name):
@@ -365,10 +384,40 @@ class Transplanter:
 
     def create_new_torrent(self) -> dict:
         report.info(tp_text.new_tor)
-        t = Torrent(self.torrent_folder_path)
+        prev_info = prev_time = None
+        if self.reuse_hashes and self.job.dtor_dict:
+            prev_info = self.job.dtor_dict['info']
+            # files modified after the source torrent was made are hashed again
+            if self.job.dtor_path:
+                prev_time = self.job.dtor_path.stat().st_mtime
+            else:
+                prev_time = self.job.dtor_dict.get('creation date')
+        t = Torrent(self.torrent_folder_path, fadvise=self.drop_page_cache, max_mb_per_s=self.io_limit_mb,
+                    max_iops=self.io_limit_iops, progress_callback=self.hash_progress, cancel=self.stop_event,
+                    prev_info=prev_info, prev_time=prev_time)
+        if t.bytes_skipped:
+            report.info(tp_text.hash_reused.format(t.reused_pieces, t.bytes_skipped / 2 ** 20))
 
         return t.data
 
+    @staticmethod
+    def hash_progress(progress: HashProgress):
+        if progress.done:
+            msg = tp_text.hash_done
+        else:
+            eta = '?' if progress.eta is None else f'{progress.eta:.0f}s'
+            msg = tp_text.hash_progress.format(progress.percentage, eta)
+        report.info(msg)
+        report.debug(tp_text.hash_stats.format(progress.pieces_hashed, progress.total_pieces,
+                                                    progress.bytes_read / 2 ** 20, progress.mb_per_s,
+                                                    progress.read_wait, progress.hash_wait))
+
+    @staticmethod
+    def hashing_report():
+        for dev, (path, n_bytes, seconds) in device_stats.pop_stats().items():
+            mb = n_bytes / 2 ** 20
+            report.info(tp_text.hash_throughput.format(dev, path.parent, mb, seconds, mb / (seconds or 1e-9)))
+
     def check_path(self, rel_path: Path) -> Path | None:
         stripped = Path(str(rel_path).translate(utils.uni_t_table))
 
@@ -390,6 +439,9 @@ class Transplanter:
             return True
 
         for info_path in self.tor_info.file_paths():
+            if self.stop_event.is_set():
+                report.warning(tp_text.stopped)
+                return False
             if self.check_path(info_path) is None:
                 report.error(f"{tp_text.missing} {info_path}")
                 return False
@@ -21,7 +21,9 @@ if __name__ == "__main__":
 
     app = Application(sys.argv)
     from GUI.control_room import start_up, save_state
+    from lib.lean_torrent import shutdown_hash_pool
 
     start_up()
     app.aboutToQuit.connect(save_state)
+    app.aboutToQuit.connect(shutdown_hash_pool)
     sys.exit(app.exec())
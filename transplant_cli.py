@@ -10,6 +10,7 @@ from lib import tp_text
 from cli_config import cli_config
 from lib.utils import tb_line_gen
 from lib.img_rehost import IH
+from lib.lean_torrent import shutdown_hash_pool
 from gazelle.tracker_data import TR
 
 
@@ -135,7 +136,16 @@ def main():
         'src_descr_templ': cli_config.src_descr,
         'img_rehost': cli_config.img_rehost,
         'whitelist': cli_config.whitelist,
+        'rehost_race': cli_config.rehost_race,
+        'rehost_adaptive': cli_config.rehost_adaptive,
         'post_compare': cli_config.post_upload_checks,
+        'drop_page_cache': cli_config.drop_page_cache,
+        'io_limit_mb': cli_config.io_limit_mb,
+        'io_limit_iops': cli_config.io_limit_iops,
+        'reuse_hashes': cli_config.reuse_hashes,
+        'api_pool_size': cli_config.api_pool_size,
+        'api_timeout': cli_config.api_timeout,
+        'api_retries': cli_config.api_retries,
     }
     if cli_config.img_rehost:
         IH.set_attrs(cli_config.image_hosts)
@@ -152,5 +162,8 @@ def main():
         finally:
             report.info('')
 
+    transplanter.hashing_report()
+    shutdown_hash_pool()
+
 if __name__ == "__main__":
     main()